@@ -64,55 +64,31 @@ def get_all_tickers(engine, min_avg_volume, year_gap):
 
 # Function to analyze a single ticker
 # Moved from suggestion_visualization.py to allow reuse in analyze_visualization.py
-def analyze_ticker(ticker, day_range, result_day_range, engine):
+# raise_errors re-raises query failures instead of returning None, so callers that cache
+# the result can tell a transient error from a ticker that really lacks data.
+def analyze_ticker(ticker, day_range, result_day_range, engine, raise_errors=False):
     if day_range < 2:
         return None
     try:
         lag_days = day_range - 1
 
-        # 1. Get latest data to calculate current_delta
-        query_latest = """
-            SELECT date, close, exchange 
-            FROM trading_data 
-            WHERE ticker = %(ticker)s 
-            ORDER BY date DESC 
-            LIMIT %(limit)s
-        """
-        
-        conn = engine.raw_connection()
-        try:
-            df_latest = pd.read_sql(query_latest, conn, params={"ticker": ticker, "limit": day_range})
-        finally:
-            conn.close()
-
-        exchange = df_latest.iloc[0]["exchange"] if not df_latest.empty and "exchange" in df_latest.columns else "Unknown"
-
-        # Ensure we have enough data points to calculate the delta
-        if len(df_latest) < day_range:
-            print(f"Insufficient data for {ticker}: Found {len(df_latest)} rows, needed {day_range}.")
-            return None
-            
-        current_close = df_latest.iloc[0]["close"]
-        end_date = df_latest.iloc[0]["date"]
-        prev_close = df_latest.iloc[-1]["close"]
-        start_date = df_latest.iloc[-1]["date"]
-        
-        if prev_close == 0:
-            print(f"Zero previous close price detected for {ticker}.")
-            return None
-            
-        # Calculate the current delta for this specific ticker
-        # Convert to native Python float to avoid Psycopg2 adapter issues with numpy types
-        current_delta = float(round(((current_close - prev_close) / prev_close * 100), 2))
-        
-        # 2. Set target range based on current delta
-        delta_min = current_delta - 1
-        delta_max = current_delta + 1
-
-        # 3. Run historical analysis using the calculated target
+        # Single round trip: the `latest` CTE takes the most recent row of delta_calc, whose
+        # exact_delta is the current delta for this ticker, and the historical aggregates are
+        # filtered to events within +/- 1% of it. The latest close date, signal start date and
+        # exchange are returned alongside the aggregates.
         # Use centralized thresholds (:up_threshold, :down_threshold) instead of hardcoded values
-        query_str = BASE_DELTA_CALC_CTE + """
+        query_str = BASE_DELTA_CALC_CTE + """,
+            latest AS (
+                SELECT date, start_date, exact_delta
+                FROM delta_calc
+                ORDER BY date DESC
+                LIMIT 1
+            )
             SELECT
+                (SELECT exchange FROM trading_data WHERE ticker = :ticker ORDER BY date DESC LIMIT 1) AS exchange,
+                (SELECT date FROM latest) AS end_date,
+                (SELECT start_date FROM latest) AS start_date,
+                (SELECT exact_delta FROM latest) AS current_delta,
                 COUNT(*) FILTER (WHERE result_delta > :up_threshold) AS up_count,
                 COUNT(*) FILTER (WHERE result_delta < :down_threshold) AS down_count,
                 COUNT(*) FILTER (WHERE result_delta BETWEEN :down_threshold AND :up_threshold) AS no_change_count,
@@ -122,6 +98,9 @@ def analyze_ticker(ticker, day_range, result_day_range, engine):
                 MIN(result_delta) FILTER (WHERE result_delta < 0) AS min_down_delta,
                 PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY result_delta) FILTER (WHERE result_delta < 0) AS median_down_delta,
                 MAX(result_delta) FILTER (WHERE result_delta < 0) AS max_down_delta,
+                MIN(result_delta) FILTER (WHERE result_delta BETWEEN :down_threshold AND :up_threshold) AS min_no_change_delta,
+                PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY result_delta) FILTER (WHERE result_delta BETWEEN :down_threshold AND :up_threshold) AS median_no_change_delta,
+                MAX(result_delta) FILTER (WHERE result_delta BETWEEN :down_threshold AND :up_threshold) AS max_no_change_delta,
                 COUNT(*) AS total_signals
             FROM delta_calc
         """ + COMMON_DELTA_FILTER_WHERE_CLAUSE
@@ -130,8 +109,9 @@ def analyze_ticker(ticker, day_range, result_day_range, engine):
         query_str = query_str.replace(":ticker", "%(ticker)s")
         query_str = query_str.replace(":validation_days", "%(validation_days)s")
         query_str = query_str.replace(":result_days", "%(result_days)s")
-        query_str = query_str.replace(":delta_min", "%(delta_min)s")
-        query_str = query_str.replace(":delta_max", "%(delta_max)s")
+        # The target range is derived from the current delta inside the same statement
+        query_str = query_str.replace(":delta_min", "(SELECT exact_delta - 1 FROM latest)")
+        query_str = query_str.replace(":delta_max", "(SELECT exact_delta + 1 FROM latest)")
         query_str = query_str.replace(":up_threshold", "%(up_threshold)s")
         query_str = query_str.replace(":down_threshold", "%(down_threshold)s")
 
@@ -139,8 +119,6 @@ def analyze_ticker(ticker, day_range, result_day_range, engine):
             "ticker": ticker,
             "validation_days": lag_days,
             "result_days": result_day_range,
-            "delta_min": delta_min,
-            "delta_max": delta_max,
             "up_threshold": DELTA_UP_THRESHOLD,
             "down_threshold": DELTA_DOWN_THRESHOLD
         }
@@ -150,6 +128,17 @@ def analyze_ticker(ticker, day_range, result_day_range, engine):
             result = pd.read_sql(query_str, conn, params=params).iloc[0]
         finally:
             conn.close()
+
+        # A NULL current delta means the ticker has fewer than day_range rows
+        if pd.isna(result["current_delta"]):
+            print(f"Insufficient data for {ticker}: needed {day_range} rows.")
+            return None
+
+        exchange = result["exchange"] if not pd.isna(result["exchange"]) else "Unknown"
+        start_date = result["start_date"]
+        end_date = result["end_date"]
+        # Convert to native Python float to avoid Psycopg2 adapter issues with numpy types
+        current_delta = float(result["current_delta"])
         
         if result["total_signals"] > 0:
             possibility_up = round((result["up_count"] / result["total_signals"]) * 100, 2)
@@ -200,6 +189,9 @@ def analyze_ticker(ticker, day_range, result_day_range, engine):
             "start_date": start_date,
             "end_date": end_date,
             "total_signals": result["total_signals"],
+            "up_count": result["up_count"],
+            "down_count": result["down_count"],
+            "no_change_count": result["no_change_count"],
             "possibility_up": possibility_up,
             "possibility_down": possibility_down,
             "min_up_delta": result["min_up_delta"],
@@ -208,11 +200,16 @@ def analyze_ticker(ticker, day_range, result_day_range, engine):
             "min_down_delta": result["min_down_delta"],
             "median_down_delta": result["median_down_delta"],
             "max_down_delta": result["max_down_delta"],
+            "min_no_change_delta": result["min_no_change_delta"],
+            "median_no_change_delta": result["median_no_change_delta"],
+            "max_no_change_delta": result["max_no_change_delta"],
             "stat_trend": stat_trend,
             "tech_trend": tech_trend,
             "tech_score": tech_score
         }
     except Exception as e:
+        if raise_errors:
+            raise
         # Avoid flooding logs with tracebacks for expected missing data/columns
         if "exchange" not in str(e).lower():
             print(f"Error analyzing ticker {ticker}: {e}")
@@ -14,14 +14,27 @@ from commons.technical_analysis import (
     calculate_stochastic_trend, calculate_rsi_trend
 )
 
-# Function to analyze price movements
-def analyze_price_movement(ticker, validation_days, result_days, delta_target, engine):
-    if validation_days < 2:
-        return pd.DataFrame(columns=["no. events", "exact_delta", "result", "result_delta", "signal_date_range"])
-
-    lag_days = validation_days - 1
+# Server-side prepared statement for analyze_price_movement, so PostgreSQL parses and plans
+# the window-function query once per pooled connection instead of on every call.
+# Parameters are listed in positional ($n) order together with their SQL types.
+PRICE_MOVEMENT_STMT = "analyze_price_movement_stmt"
+PRICE_MOVEMENT_PARAMS = [
+    ("ticker", "TEXT"),
+    ("validation_days", "INTEGER"),
+    ("result_days", "INTEGER"),
+    ("delta_min", "NUMERIC"),
+    ("delta_max", "NUMERIC"),
+    ("up_threshold", "NUMERIC"),
+    ("down_threshold", "NUMERIC"),
+]
+
+def _build_price_movement_prepare():
+    # Event numbering and final column order are produced by the query itself,
+    # so the DataFrame returned by read_sql is already display-ready.
+    # event_date is kept internally to allow joining with historical technical indicator data.
     query_str = BASE_DELTA_CALC_CTE + """
         SELECT
+            ROW_NUMBER() OVER (ORDER BY date) AS "no. events",
             date AS event_date,
             exact_delta,
             CASE 
@@ -32,18 +45,27 @@ def analyze_price_movement(ticker, validation_days, result_days, delta_target, e
             result_delta, signal_date_range
         FROM delta_calc
     """ + COMMON_DELTA_FILTER_WHERE_CLAUSE + """
-        ORDER BY date;
+        ORDER BY date
     """
-    
-    # Convert SQLAlchemy :param syntax to Psycopg2 %(param)s syntax for raw connection
-    query_str = query_str.replace(":ticker", "%(ticker)s")
-    query_str = query_str.replace(":validation_days", "%(validation_days)s")
-    query_str = query_str.replace(":result_days", "%(result_days)s")
-    query_str = query_str.replace(":delta_min", "%(delta_min)s")
-    query_str = query_str.replace(":delta_max", "%(delta_max)s")
-    query_str = query_str.replace(":up_threshold", "%(up_threshold)s")
-    query_str = query_str.replace(":down_threshold", "%(down_threshold)s")
-    
+    # Convert SQLAlchemy :param syntax to PREPARE's positional $n syntax
+    for position, (name, _) in enumerate(PRICE_MOVEMENT_PARAMS, start=1):
+        query_str = query_str.replace(f":{name}", f"${position}")
+    param_types = ", ".join(sql_type for _, sql_type in PRICE_MOVEMENT_PARAMS)
+    return f"PREPARE {PRICE_MOVEMENT_STMT} ({param_types}) AS {query_str};"
+
+PRICE_MOVEMENT_PREPARE = _build_price_movement_prepare()
+PRICE_MOVEMENT_EXECUTE = f"EXECUTE {PRICE_MOVEMENT_STMT} (" + ", ".join(
+    f"%({name})s" for name, _ in PRICE_MOVEMENT_PARAMS
+) + ");"
+
+# Function to analyze price movements
+# Results are cached per (ticker, validation_days, result_days, delta_target)
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=256)
+def analyze_price_movement(ticker, validation_days, result_days, delta_target, _engine):
+    if validation_days < 2:
+        return pd.DataFrame(columns=["no. events", "event_date", "exact_delta", "result", "result_delta", "signal_date_range"])
+
+    lag_days = validation_days - 1
     delta_min = float(delta_target - 1)
     delta_max = float(delta_target + 1)
     
@@ -59,25 +81,33 @@ def analyze_price_movement(ticker, validation_days, result_days, delta_target, e
     
     # Use a raw connection to bypass pandas/SQLAlchemy compatibility issues
     # This fixes "TypeError: Query must be a string unless using sqlalchemy"
-    conn = engine.raw_connection()
+    conn = _engine.raw_connection()
     try:
-        df = pd.read_sql(query_str, conn, params=params)
+        # Prepared statements live in the database session; conn.info follows the pooled
+        # DBAPI connection, so each session prepares the statement exactly once.
+        if not conn.info.get(PRICE_MOVEMENT_STMT):
+            with conn.cursor() as cursor:
+                cursor.execute(PRICE_MOVEMENT_PREPARE)
+            conn.commit()
+            conn.info[PRICE_MOVEMENT_STMT] = True
+        df = pd.read_sql(PRICE_MOVEMENT_EXECUTE, conn, params=params)
     finally:
         conn.close()
     
-    if not df.empty:
-        df["no. events"] = range(1, len(df) + 1)
-        # Round numerical columns to 2 decimal places for cleaner display
-        df["exact_delta"] = df["exact_delta"].round(2)
-        df["result_delta"] = df["result_delta"].round(2)
-        # Include event_date internally to allow joining with historical technical indicator data
-        df = df[["no. events", "event_date", "exact_delta", "result", "result_delta", "signal_date_range"]]
-    else:        
-        # Ensure consistent column structure even on empty results
-        df = pd.DataFrame(columns=["no. events", "event_date", "exact_delta", "result", "result_delta", "signal_date_range"])
-    
+    # Deltas are already rounded to 2 decimal places by BASE_DELTA_CALC_CTE,
+    # and the empty result keeps the column structure defined by the SELECT.
     return df
 
+# Cached wrapper around analyze_ticker for the interactive Analyze flow.
+# Kept in the pages layer (and used only from the script thread) so the API and the
+# portfolio worker threads keep calling analyze_ticker directly.
+# Results are cached per (ticker, validation_days, result_days).
+# Query failures are raised rather than returned as None: st.cache_data does not store
+# exceptions, so a transient DB error is retried on the next click instead of being cached.
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=256)
+def cached_analyze_ticker(ticker, validation_days, result_days, _engine):
+    return analyze_ticker(ticker, validation_days, result_days, _engine, raise_errors=True)
+
 # Function to provide advice with three options
 def provide_advice(validation_days, result_days, analysis_results):
     # analysis_results is the dictionary from analyze_ticker
@@ -315,7 +345,11 @@ def analyze_page(engine):
             ticker = ticker.upper()
             
             # 1. Get summary stats, current delta, and date range from the common function
-            analysis_results = analyze_ticker(ticker, validation_days, result_days, engine)
+            try:
+                analysis_results = cached_analyze_ticker(ticker, validation_days, result_days, engine)
+            except Exception as e:
+                st.error(f"Error analyzing {ticker}: {e}")
+                return
             
             if analysis_results is None:
                 st.error("Not enough data to calculate the latest signal or run analysis. Check container logs for details.")
@@ -336,7 +370,8 @@ def analyze_page(engine):
             statistical_advice_display, statistical_trend = provide_advice(validation_days, result_days, analysis_results)
             
             # --- 2.1 Analyzed Statistical Report ---
-            # Re-creating report from analysis_results for display
+            # The per-result counts, ranges and medians are aggregated in SQL by analyze_ticker,
+            # so the report only formats the returned values for display
             st.subheader("Analyzed Statistical Report")
             if analysis_results["total_signals"] > 0:
                 up_prob = analysis_results['possibility_up']
@@ -346,9 +381,9 @@ def analyze_page(engine):
                 # Helper to format numbers to 2 decimal places safely
                 fmt = lambda x: f"{x:.2f}" if isinstance(x, (int, float)) else "N/A"
 
-                up_count = round(analysis_results['total_signals'] * (up_prob / 100))
-                down_count = round(analysis_results['total_signals'] * (down_prob / 100))
-                no_change_count = analysis_results['total_signals'] - up_count - down_count
+                up_count = analysis_results['up_count']
+                down_count = analysis_results['down_count']
+                no_change_count = analysis_results['no_change_count']
 
                 stats_data = []
                 if up_count > 0:
@@ -369,8 +404,8 @@ def analyze_page(engine):
                     stats_data.append({
                         "result": f"{no_change_count} times No Change", 
                         "possibility of result": f"{fmt(no_change_prob)}%", 
-                        "result range": "N/A", # This info is not in analyze_ticker
-                        "median": "N/A" # This info is not in analyze_ticker
+                        "result range": f"{fmt(analysis_results.get('min_no_change_delta'))}% to {fmt(analysis_results.get('max_no_change_delta'))}%", 
+                        "median": f"{fmt(analysis_results.get('median_no_change_delta'))}%"
                     })
                 
                 df_stats_display = pd.DataFrame(stats_data)
@@ -450,17 +485,19 @@ def analyze_page(engine):
                         if not matches.empty:
                             # Categorize matching scores based on technical trend logic:
                             # Up (>= 53), Sideway (48-52), Down (< 48)
-                            up_m = matches[matches['Technical score'] >= 53]
-                            sw_m = matches[(matches['Technical score'] >= 48) & (matches['Technical score'] < 53)]
-                            dw_m = matches[matches['Technical score'] < 48]
+                            # Bucket once and aggregate count/mean per bucket in a single groupby pass
+                            scores = pd.to_numeric(matches['Technical score'], errors='coerce')
+                            buckets = pd.cut(scores, bins=[float('-inf'), 48, 53, float('inf')], right=False,
+                                             labels=["Down", "Sideway", "Up"])
+                            tech_stats = scores.groupby(buckets, observed=False).agg(["count", "mean"]).fillna(0)
                             
                             # Lookup emoji for predicted result category (target_res is Up, No Change, or Down)
                             res_emoji = TREND_EMOJIS.get(target_res, TREND_EMOJIS.get("Sideways" if target_res == "No Change" else "Unknown", "❓"))
                             
                             summary_txt = (f"technical trend summary of {len(matches)} times {target_res} {res_emoji}: "
-                                          f"{len(up_m)} times Up 📈 (Avg. score: {up_m['Technical score'].mean() if not up_m.empty else 0:.1f}%), "
-                                          f"{len(sw_m)} times Sideway/Unknowns ♻️ (Avg. score: {sw_m['Technical score'].mean() if not sw_m.empty else 0:.1f}%), "
-                                          f"{len(dw_m)} times Down 📉 (Avg. score: {dw_m['Technical score'].mean() if not dw_m.empty else 0:.1f}%)")
+                                          f"{int(tech_stats.loc['Up', 'count'])} times Up 📈 (Avg. score: {tech_stats.loc['Up', 'mean']:.1f}%), "
+                                          f"{int(tech_stats.loc['Sideway', 'count'])} times Sideway/Unknowns ♻️ (Avg. score: {tech_stats.loc['Sideway', 'mean']:.1f}%), "
+                                          f"{int(tech_stats.loc['Down', 'count'])} times Down 📉 (Avg. score: {tech_stats.loc['Down', 'mean']:.1f}%)")
                             st.markdown(f"*{summary_txt}*")
 
             # --- 2.3 Block Day and Delta Statistical Report ---
@@ -2,36 +2,43 @@ import streamlit as st
 import requests
 import zipfile
 import os
-import pandas as pd
 from sqlalchemy import create_engine, text, event
 from sqlalchemy.types import BigInteger
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, time as dt_time
 import pytz
 import shutil
-import tempfile
+import io
 import time
 import threading
-
-# Import the high-performance `execute_values` helper from psycopg2
-from psycopg2.extras import execute_values
+import concurrent.futures
 
 # Global lock to prevent multiple data preparation tasks from running concurrently
 # Shared by both the Streamlit UI and the FastAPI background thread
 data_prep_lock = threading.Lock()
 
+# Upper bound on CSV files loaded concurrently (one pooled DB connection each)
+MAX_INGEST_WORKERS = min(8, os.cpu_count() or 1)
+
+# Report dates are decided in Vietnam time (GMT+7); cafef publishes the day's data after 8 PM
+VN_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
+EIGHT_PM = dt_time(20, 0)
+
+# Ingestion loads into this table and swaps it in for trading_data only once the load succeeded
+LOAD_TABLE = "trading_data_load"
+
 # --- Headless Support Helpers ---
-def log_progress(msg, level="info"):
-    """Logs messages to Streamlit UI if available, otherwise to console."""
-    # Check for script context to determine if we are in a Streamlit thread
+def _in_script_thread():
+    """Returns True when running in a Streamlit script thread (not the API or a worker thread)."""
     # We use a defensive check to avoid "missing ScriptRunContext" warnings in background threads
-    ctx = None
     try:
         from streamlit.runtime.scriptrunner import get_script_run_ctx
-        ctx = get_script_run_ctx()
+        return get_script_run_ctx() is not None
     except (ImportError, RuntimeError):
-        pass
+        return False
 
-    if ctx is not None:
+def log_progress(msg, level="info"):
+    """Logs messages to Streamlit UI if available, otherwise to console."""
+    if _in_script_thread():
         if level == "error": st.error(msg)
         elif level == "warning": st.warning(msg)
         elif level == "success": st.success(msg)
@@ -41,12 +48,25 @@ def log_progress(msg, level="info"):
     # Fallback to standard console output for API or background tasks
     print(f"[DATA PREP] {level.upper()}: {msg}")
 
+def create_progress_bar():
+    """Returns a Streamlit progress bar in a script thread, otherwise None (API or background tasks)."""
+    return st.progress(0.0) if _in_script_thread() else None
+
 # Database connection
+# The engine is created once per app lifecycle by main.initialize_global_services (st.cache_resource).
+# The pool must cover the parallel CSV loaders (MAX_INGEST_WORKERS) plus concurrent page/API queries;
+# pre-ping and recycling drop connections the server has closed while the app sat idle.
 def get_engine_with_retry(database_url, retries=5, delay=5):
     attempt = 0
     while attempt < retries:
         try:
-            engine = create_engine(database_url)
+            engine = create_engine(
+                database_url,
+                pool_size=5,
+                max_overflow=10,
+                pool_pre_ping=True,
+                pool_recycle=1800,
+            )
             with engine.connect() as conn:
                 conn.execute(text("SELECT 1"))
             return engine
@@ -59,10 +79,15 @@ def get_engine_with_retry(database_url, retries=5, delay=5):
             time.sleep(delay)
 
 # Create trading_data table with BIGINT for numerical columns
-def init_db(engine):
+# table_name lets the ingestion create its load table with the same schema; identifiers cannot be
+# bound parameters, so only the two known table names are accepted. The load table is created unlogged.
+def init_db(engine, table_name="trading_data"):
+    if table_name not in ("trading_data", LOAD_TABLE):
+        raise ValueError(f"Unexpected table name: {table_name}")
+    unlogged = "UNLOGGED" if table_name == LOAD_TABLE else ""
     with engine.connect() as conn:
-        conn.execute(text("""
-            CREATE TABLE IF NOT EXISTS trading_data (
+        conn.execute(text(f"""
+            CREATE {unlogged} TABLE IF NOT EXISTS {table_name} (
                 ticker TEXT,
                 exchange TEXT,
                 date DATE,
@@ -78,46 +103,83 @@ def init_db(engine):
         
         # Ensure the exchange column exists (handles updates to existing tables)
         # Postgres 9.6+ supports ADD COLUMN IF NOT EXISTS
-        conn.execute(text("""
-            ALTER TABLE trading_data ADD COLUMN IF NOT EXISTS exchange TEXT;
+        conn.execute(text(f"""
+            ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS exchange TEXT;
         """))
 
         # Strict Schema Verification
         result = conn.execute(text("""
             SELECT column_name, data_type 
             FROM information_schema.columns 
-            WHERE table_name = 'trading_data' 
+            WHERE table_name = :table_name 
             AND column_name IN ('exchange', 'open', 'high', 'low', 'close', 'volume');
-        """)).fetchall()
+        """), {"table_name": table_name}).fetchall()
         
         if len(result) < 6:
             missing = 6 - len(result)
-            log_progress(f"Schema verification failed: {missing} columns missing from trading_data", "error")
+            log_progress(f"Schema verification failed: {missing} columns missing from {table_name}", "error")
             raise ValueError("Incomplete database schema. Missing required columns.")
 
         for col, dtype in result:
             expected = 'text' if col == 'exchange' else 'bigint'
             if dtype.lower() != expected:
                 log_progress(f"Column {col} is {dtype}, expected {expected.upper()}", "error")
-                raise ValueError(f"Invalid schema for trading_data: {col} is {dtype}")
+                raise ValueError(f"Invalid schema for {table_name}: {col} is {dtype}")
         conn.commit()
 
+# Create an empty load table for a bulk reload. trading_data keeps serving reads until the swap.
+# The load table is unlogged and has no secondary indexes, so loading skips WAL and index maintenance.
+# The primary key is kept because the ingestion relies on ON CONFLICT (ticker, date) to deduplicate rows.
+def prepare_bulk_load(engine):
+    with engine.begin() as conn:
+        # Leftover from a failed run, if any
+        conn.execute(text(f"DROP TABLE IF EXISTS {LOAD_TABLE};"))
+    init_db(engine, LOAD_TABLE)
+
+# After all datasets are loaded: cluster the table, restore durability, build the secondary
+# indexes once, then atomically replace trading_data with the load table.
+# The steps run in this order because CLUSTER and SET LOGGED each rewrite the table and rebuild
+# every index on it; building the secondary indexes last means each is built exactly once.
+# Both secondary indexes are covering (INCLUDE) so the hot queries can use index-only scans:
+# idx_ticker_date serves the per-ticker window queries and fetch_data, idx_date_ticker the
+# date-range aggregates of the Result page.
+def finalize_bulk_load(engine):
+    with engine.begin() as conn:
+        # Give the one-off sort and index builds enough memory to stay in RAM (this transaction only)
+        conn.execute(text("SET LOCAL maintenance_work_mem = '512MB';"))
+        # Rewrite the table in (ticker, date) order so per-ticker scans read contiguous pages.
+        # The primary key has that order, and the table is still unlogged, so the rewrite skips WAL.
+        conn.execute(text(f"CLUSTER {LOAD_TABLE} USING {LOAD_TABLE}_pkey;"))
+        conn.execute(text(f"ALTER TABLE {LOAD_TABLE} SET LOGGED;"))
+        conn.execute(text(f"CREATE INDEX idx_ticker_date_load ON {LOAD_TABLE} (ticker, date DESC) INCLUDE (open, high, low, close, volume);"))
+        conn.execute(text(f"CREATE INDEX idx_date_ticker_load ON {LOAD_TABLE} (date) INCLUDE (ticker, close, volume);"))
+
+    # VACUUM cannot run inside a transaction block. It sets the visibility map of the rewritten
+    # table (required before the planner picks index-only scans) and refreshes planner statistics.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"VACUUM ANALYZE {LOAD_TABLE};"))
+
+    # Swap in one short transaction: readers see either the old or the new data, never an empty table.
+    # Index names are global per schema, so they are renamed to the usual names after the old ones are gone.
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS trading_data;"))
+        conn.execute(text(f"ALTER TABLE {LOAD_TABLE} RENAME TO trading_data;"))
+        conn.execute(text(f"ALTER INDEX {LOAD_TABLE}_pkey RENAME TO trading_data_pkey;"))
+        conn.execute(text("ALTER INDEX idx_ticker_date_load RENAME TO idx_ticker_date;"))
+        conn.execute(text("ALTER INDEX idx_date_ticker_load RENAME TO idx_date_ticker;"))
+
 # Function to get the last trading day (Monday to Friday)
 def get_last_trading_day(current_date):
-    if current_date.weekday() == 5:  # Saturday
-        return current_date - timedelta(days=1)
-    elif current_date.weekday() == 6:  # Sunday
-        return current_date - timedelta(days=2)
-    return current_date
+    weekday = current_date.weekday()
+    if weekday < 5:  # Monday to Friday
+        return current_date
+    # Saturday -> Friday (1 day back), Sunday -> Friday (2 days back)
+    return current_date - timedelta(days=weekday - 4)
 
 # Function to determine default report date based on GMT+7 time
 def get_default_report_date():
-    tz = pytz.timezone('Asia/Ho_Chi_Minh')
-    now = datetime.now(tz)
-    current_time = now.time()
-    eight_pm = datetime.strptime("20:00", "%H:%M").time()
-
-    if current_time >= eight_pm:
+    now = datetime.now(VN_TZ)
+    if now.time() >= EIGHT_PM:
         report_date = now.date()
     else:
         report_date = now.date() - timedelta(days=1)
@@ -126,183 +188,172 @@ def get_default_report_date():
 
     return get_last_trading_day(report_date)
 
-# Function to clean up files
-def cleanup_files(zip_path, extract_path):
+# Function to process a CSV stream: PostgreSQL parses, filters and scales the rows
+# csv_stream is any binary file-like object (e.g. a ZIP member); runs on the caller's connection/transaction
+# Returns the number of rows inserted into the load table
+def process_csv_file(csv_stream, file_name, cutoff_date, conn, ticker_filter=None, exchange="Unknown"):
+    # Index files are restricted to a single ticker; stock files keep tickers of up to 7 characters
+    ticker_condition = "ticker = :ticker_filter" if ticker_filter is not None else "LENGTH(ticker) <= 7"
+
+    # Raw staging table matching the CSV layout: <Ticker>,<DTYYYYMMDD>,<Open>,<High>,<Low>,<Close>,<Volume>
+    # The date column is typed DATE so COPY parses YYYYMMDD (ISO 8601 basic format) in C.
+    # Created once per pooled session and emptied on every commit, so later files (and later
+    # ingestions) reuse it instead of creating and dropping a table each time.
+    # Temporary tables are never WAL-logged.
+    conn.execute(text("""
+        CREATE TEMPORARY TABLE IF NOT EXISTS temp_chunk (
+            ticker TEXT,
+            date DATE,
+            open DOUBLE PRECISION,
+            high DOUBLE PRECISION,
+            low DOUBLE PRECISION,
+            close DOUBLE PRECISION,
+            volume DOUBLE PRECISION
+        ) ON COMMIT DELETE ROWS;
+    """))
+
+    # Stream the file as-is through COPY; the server's C parser handles the CSV,
+    # HEADER skips the column-name row (including the UTF-8 BOM).
+    # Read the stream in 1 MiB blocks (psycopg2 defaults to 8 KiB) to cut per-read overhead.
     try:
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-            log_progress(f"Deleted ZIP file: {zip_path}")
-        if os.path.exists(extract_path):
-            shutil.rmtree(extract_path)
-            log_progress(f"Deleted extracted folder: {extract_path}")
+        with conn.connection.cursor() as cursor:
+            cursor.copy_expert("COPY temp_chunk FROM STDIN WITH (FORMAT CSV, HEADER)", csv_stream,
+                               size=1024 * 1024)
     except Exception as e:
-        log_progress(f"Error during cleanup: {str(e)}", "warning")
-
-# Function to process CSV file with chunking and ticker filtering
-def process_csv_file(file_path, cutoff_date, ticker_filter=None, chunk_size=10000, engine=None, exchange="Unknown"):
-    chunks = pd.read_csv(file_path, chunksize=chunk_size, dtype={"Open": "float64", "High": "float64", "Low": "float64", "Close": "float64", "Volume": "float64"})
-    total_rows = 0
-    filtered_rows = 0
-    last_chunk_dtypes = None
-    
-    with engine.begin() as conn:
-        conn.execute(text("""
-            CREATE TEMPORARY TABLE temp_chunk (
-                ticker TEXT,
-                exchange TEXT,
-                date DATE,
-                open BIGINT,
-                high BIGINT,
-                low BIGINT,
-                close BIGINT,
-                volume BIGINT
-            );
-        """))
+        log_progress(f"Error loading {file_name}: {str(e)}", "error")
+        raise
 
-        for chunk in chunks:
-            total_rows += len(chunk)
-            chunk.columns = ["Ticker", "DTYYYYMMDD", "Open", "High", "Low", "Close", "Volume"]
-            chunk["DTYYYYMMDD"] = pd.to_datetime(chunk["DTYYYYMMDD"], format="%Y%m%d").dt.date
-            chunk = chunk[chunk["DTYYYYMMDD"] >= cutoff_date]
-            if ticker_filter is not None:
-                chunk = chunk[chunk["Ticker"] == ticker_filter]
-            else:
-                chunk = chunk[chunk["Ticker"].str.len() <= 7]
-            filtered_rows += len(chunk)
-            
-            if not chunk.empty:
-                try:
-                    chunk["Open"] = (chunk["Open"] * 1000).round().astype('int64')
-                    chunk["High"] = (chunk["High"] * 1000).round().astype('int64')
-                    chunk["Low"] = (chunk["Low"] * 1000).round().astype('int64')
-                    chunk["Close"] = (chunk["Close"] * 1000).round().astype('int64')
-                    chunk["Volume"] = chunk["Volume"].round().astype('int64')
-                    
-                    # Assign the exchange captured from the filename
-                    # Assign the exchange and standardize column names
-                    chunk["exchange"] = exchange
-                    chunk.columns = ["ticker", "date", "open", "high", "low", "close", "volume", "exchange"]
-                    chunk = chunk.rename(columns={"Ticker": "ticker", "DTYYYYMMDD": "date", "Open": "open", "High": "high", "Low": "low", "Close": "close", "Volume": "volume"})
-
-                    # Deduplicate in Pandas
-                    chunk = chunk.drop_duplicates(subset=["ticker", "date"], keep="first")
-
-                    # Ensure columns match the SQL statement order: ticker, exchange, date, ...
-                    cols = ["ticker", "exchange", "date", "open", "high", "low", "close", "volume"]
-                    # DIRECT INSERTION USING PSYCOPG2
-                    # Bypass pandas.to_sql entirely to avoid SQLAlchemy/Pandas version conflicts
-                    with conn.connection.cursor() as cursor:
-                        execute_values(cursor, 
-                            "INSERT INTO temp_chunk (ticker, exchange, date, open, high, low, close, volume) VALUES %s", 
-                            chunk[cols].values.tolist())
-                    last_chunk_dtypes = chunk.dtypes
-                except Exception as e:
-                    log_progress(f"Error processing chunk in {os.path.basename(file_path)}: {str(e)}", "error")
-                    raise
-
-        log_progress(f"Raw data rows in {os.path.basename(file_path)}: {total_rows}")
-        log_progress(f"Rows after filtering: {filtered_rows}")
-        if last_chunk_dtypes is not None:
-            log_progress(f"Processed chunk dtypes: {last_chunk_dtypes}")
-        
-        # Log temp_chunk contents
-        temp_count = conn.execute(text("SELECT COUNT(*) FROM temp_chunk")).fetchone()[0]
-        log_progress(f"Rows in temp_chunk before insert: {temp_count}")
-        
-        # Check for duplicates in temp_chunk
-        duplicates = conn.execute(text("""
-            SELECT ticker, date, COUNT(*) 
-            FROM temp_chunk 
-            GROUP BY ticker, date 
-            HAVING COUNT(*) > 1;
-        """)).fetchall()
-        if duplicates:
-            log_progress(f"Duplicates found in temp_chunk: {duplicates}", "warning")
-        
-        # Insert into trading_data
-        try:
-            result = conn.execute(text("""
-                INSERT INTO trading_data (ticker, exchange, date, open, high, low, close, volume)
-                SELECT ticker, exchange, date, open, high, low, close, volume
-                FROM temp_chunk
-                ON CONFLICT (ticker, date) DO NOTHING
-                RETURNING ticker;
-            """))
-            inserted_rows = result.rowcount
-            log_progress(f"Inserted {inserted_rows} rows into trading_data from {os.path.basename(file_path)}")
-        except Exception as e:
-            log_progress(f"Error inserting into trading_data: {str(e)}", "error")
-            raise
-        
-        # Verify trading_data contents
-        trading_count = conn.execute(text("SELECT COUNT(*) FROM trading_data")).fetchone()[0]
-        log_progress(f"Rows in trading_data after insert: {trading_count}")
-        
-        conn.execute(text("DROP TABLE temp_chunk;"))
+    # Insert into the load table
+    # Prices are scaled to BIGINT (ROUND(price * 1000)) and volume is rounded, as in the
+    # previous pandas path. The CSV holds at most one row per (ticker, date), so the staging
+    # table is not scanned for duplicates; ON CONFLICT still keeps the first row if one slips in.
+    try:
+        result = conn.execute(text(f"""
+            INSERT INTO {LOAD_TABLE} (ticker, exchange, date, open, high, low, close, volume)
+            SELECT ticker, :exchange, date,
+                   ROUND(open * 1000)::BIGINT, ROUND(high * 1000)::BIGINT,
+                   ROUND(low * 1000)::BIGINT, ROUND(close * 1000)::BIGINT,
+                   ROUND(volume)::BIGINT
+            FROM temp_chunk
+            WHERE date >= :cutoff_date
+              AND {ticker_condition}
+            ON CONFLICT (ticker, date) DO NOTHING;
+        """), {"exchange": exchange, "cutoff_date": cutoff_date, "ticker_filter": ticker_filter})
+    except Exception as e:
+        log_progress(f"Error inserting into {LOAD_TABLE}: {str(e)}", "error")
+        raise
+
+    # The caller reports progress; no COUNT(*) scans of the staging or load table per file
+    return result.rowcount
+
+# Function to build the cafef archive URL and the ticker filter for a dataset
+def get_download_source(report_date, data_type="stock"):
+    # Normalize once here: report dates from the UI date picker or the API may fall on a weekend.
+    # get_last_trading_day is idempotent, so an already normalized default date passes through.
+    last_trading_day = get_last_trading_day(report_date)
+    ymd_to_date = last_trading_day.strftime("%Y%m%d")
+    dmy_to_date = last_trading_day.strftime("%d%m%Y")
+    if data_type == "stock":
+        url = f"https://cafef1.mediacdn.vn/data/ami_data/{ymd_to_date}/CafeF.SolieuGD.Upto{dmy_to_date}.zip"
+        ticker_filter = None
+    elif data_type == "index":
+        url = f"https://cafef1.mediacdn.vn/data/ami_data/{ymd_to_date}/CafeF.Index.Upto{dmy_to_date}.zip"
+        ticker_filter = "VNINDEX"
+    else:
+        raise ValueError(f"Unknown data_type: {data_type}")
+    return url, ticker_filter, last_trading_day
+
+# Function to download an archive into memory
+# Makes no Streamlit calls, so it can run on a worker thread
+def download_archive(url):
+    # Keep the archive in memory instead of writing it to a temp file, copying in 1 MiB chunks
+    zip_buffer = io.BytesIO()
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        # Let urllib3 undo any Content-Encoding, as iter_content did
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, zip_buffer, length=1024 * 1024)
+    zip_buffer.seek(0)
+    return zip_buffer
 
 # Function to download and process data
-def download_and_process_data(report_date, gaps_of_data, data_type="stock", engine=None):
-    with tempfile.TemporaryDirectory() as temp_dir:
-        zip_path = os.path.join(temp_dir, "stock_data.zip")
-        extract_path = os.path.join(temp_dir, "extracted")
-        
-        try:
-            last_trading_day = get_last_trading_day(report_date)
-            ymd_to_date = last_trading_day.strftime("%Y%m%d")
-            dmy_to_date = last_trading_day.strftime("%d%m%Y")
-            if data_type == "stock":
-                url = f"https://cafef1.mediacdn.vn/data/ami_data/{ymd_to_date}/CafeF.SolieuGD.Upto{dmy_to_date}.zip"
-                ticker_filter = None
-            elif data_type == "index":
-                url = f"https://cafef1.mediacdn.vn/data/ami_data/{ymd_to_date}/CafeF.Index.Upto{dmy_to_date}.zip"
-                ticker_filter = "VNINDEX"
-            else:
-                raise ValueError(f"Unknown data_type: {data_type}")
-            
-            log_progress(f"Downloading {data_type} data from {url}...")
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            with open(zip_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-
-            log_progress(f"Extracting {data_type} data...")
-            os.makedirs(extract_path, exist_ok=True)
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                zip_ref.extractall(extract_path)
-
-            log_progress(f"Processing {data_type} data...")
-            cutoff_date = last_trading_day - timedelta(days=365 * gaps_of_data)
-            
-            for csv_file in os.listdir(extract_path):
-                if csv_file.endswith(".csv"):
-                    # Detect exchange from filename (e.g., CafeF.HSX.Upto10052024.csv)
-                    file_upper = csv_file.upper()
-                    if "HSX" in file_upper:
-                        detected_exchange = "HSX"
-                    elif "HNX" in file_upper:
-                        detected_exchange = "HNX"
-                    elif "UPCOM" in file_upper:
-                        detected_exchange = "UPCOM"
-                    else:
-                        detected_exchange = "Unknown"
-                        
-                    file_path = os.path.join(extract_path, csv_file)
-                    log_progress(f"Processing {csv_file} as {detected_exchange}...")
-                    process_csv_file(file_path, cutoff_date, ticker_filter, engine=engine, exchange=detected_exchange)
+# source (the get_download_source tuple) and zip_buffer take an already resolved source and
+# downloaded archive (see run_full_ingestion)
+def download_and_process_data(report_date, gaps_of_data, data_type="stock", engine=None, zip_buffer=None, source=None):
+    if source is None:
+        source = get_download_source(report_date, data_type)
+    url, ticker_filter, last_trading_day = source
+    if zip_buffer is None:
+        log_progress(f"Downloading {data_type} data from {url}...")
+        zip_buffer = download_archive(url)
 
-            with engine.connect() as conn:
-                conn.execute(text("DROP INDEX IF EXISTS idx_ticker_date;"))
-                conn.execute(text("CREATE INDEX idx_ticker_date ON trading_data (ticker, date DESC);"))
-                conn.commit()
-                result = conn.execute(text("SELECT COUNT(*) FROM trading_data")).fetchone()
-                log_progress(f"Total rows in trading_data after {data_type} insert: {result[0]}")
+    log_progress(f"Processing {data_type} data...")
+    cutoff_date = last_trading_day - timedelta(days=365 * gaps_of_data)
+    
+    # Read the CSV members straight out of the archive and stream them into COPY;
+    # nothing is extracted to disk
+    with zipfile.ZipFile(zip_buffer, "r") as zip_ref:
+        csv_jobs = []
+        for member in zip_ref.namelist():
+            if member.endswith(".csv"):
+                # Detect exchange from filename (e.g., CafeF.HSX.Upto10052024.csv)
+                file_upper = os.path.basename(member).upper()
+                if "HSX" in file_upper:
+                    detected_exchange = "HSX"
+                elif "HNX" in file_upper:
+                    detected_exchange = "HNX"
+                elif "UPCOM" in file_upper:
+                    detected_exchange = "UPCOM"
+                else:
+                    detected_exchange = "Unknown"
+                csv_jobs.append((member, detected_exchange))
 
-            log_progress(f"{data_type.capitalize()} data saved to database.")
-        except Exception as e:
-            raise
-        finally:
-            cleanup_files(zip_path, extract_path)
+        # Load the CSVs in parallel: each worker checks out its own pooled connection and
+        # runs one transaction per file, so PostgreSQL parses several COPY streams at once.
+        # temp_chunk is a session-private temporary table, so workers do not collide, and
+        # ZipFile supports reading several members concurrently.
+        # Accepted behaviour change from the sequential load: if the same (ticker, date) appears in
+        # more than one file (a ticker listed on two exchanges on the same day), the file whose
+        # INSERT commits first keeps the row, so the stored exchange is not tied to archive order.
+        # Such keys are rare, so the loaders seldom wait on each other's ON CONFLICT row locks.
+        def load_csv(member, detected_exchange):
+            with zip_ref.open(member) as csv_stream, engine.begin() as conn:
+                # The load table is rebuilt from scratch on every run, so a crash just means re-running;
+                # don't wait for the WAL flush when each file's transaction commits
+                conn.execute(text("SET LOCAL synchronous_commit = off;"))
+                return process_csv_file(csv_stream, os.path.basename(member), cutoff_date, conn,
+                                        ticker_filter=ticker_filter, exchange=detected_exchange)
+
+        # One progress step per file; the summary is built from the INSERT row counts.
+        # The as_completed loop runs on the calling (script) thread, so the bar and errors reach the UI.
+        total_inserted = 0
+        if csv_jobs:
+            progress = create_progress_bar()
+            max_workers = min(MAX_INGEST_WORKERS, len(csv_jobs))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                future_to_file = {
+                    executor.submit(load_csv, member, detected_exchange): (os.path.basename(member), detected_exchange)
+                    for member, detected_exchange in csv_jobs
+                }
+                for i, future in enumerate(concurrent.futures.as_completed(future_to_file)):
+                    file_name, detected_exchange = future_to_file[future]
+                    try:
+                        inserted_rows = future.result()
+                    except Exception as e:
+                        # Report the failed file from the calling thread so it reaches the UI. The load
+                        # table is discarded on failure, so skip the queued files before re-raising.
+                        log_progress(f"Error loading {file_name}: {str(e)}", "error")
+                        for pending in future_to_file:
+                            pending.cancel()
+                        raise
+                    total_inserted += inserted_rows
+                    # Per-file detail goes to the console only; the UI shows the progress bar and the summary
+                    print(f"[DATA PREP] INFO: Loaded {inserted_rows} rows from {file_name} ({detected_exchange})")
+                    if progress is not None:
+                        progress.progress((i + 1) / len(csv_jobs), text=file_name)
+
+    log_progress(f"{data_type.capitalize()} data saved to database: {total_inserted} rows from {len(csv_jobs)} files.")
+    return total_inserted
 
 # --- Centralized Ingestion Logic ---
 def run_full_ingestion(report_date, gaps_of_data, engine):
@@ -316,15 +367,32 @@ def run_full_ingestion(report_date, gaps_of_data, engine):
         
     try:
         log_progress(f"Starting full data ingestion for report date: {report_date}")
-        with engine.connect() as conn:
-            log_progress("Resetting trading_data table for schema synchronization...")
-            conn.execute(text("DROP TABLE IF EXISTS trading_data;"))
-            conn.commit()
-        
-        init_db(engine)
+        # The load table is created from the current schema and replaces trading_data on success,
+        # which also keeps the schema in sync; on failure trading_data is left untouched
+        log_progress(f"Preparing {LOAD_TABLE} for the reload...")
+        prepare_bulk_load(engine)
             
-        download_and_process_data(report_date, gaps_of_data, "stock", engine=engine)
-        download_and_process_data(report_date, gaps_of_data, "index", engine=engine)
+        # The stock and index archives are independent, so both downloads run concurrently.
+        # The datasets are then loaded one after the other on this thread, which keeps their
+        # progress and error messages in the UI; each still fans its CSV files out over a worker pool.
+        data_types = ("stock", "index")
+        total_rows = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(data_types)) as executor:
+            sources, downloads = {}, {}
+            for data_type in data_types:
+                sources[data_type] = get_download_source(report_date, data_type)
+                url = sources[data_type][0]
+                log_progress(f"Downloading {data_type} data from {url}...")
+                downloads[data_type] = executor.submit(download_archive, url)
+            for data_type in data_types:
+                # Re-raises a failed download in the calling thread
+                zip_buffer = downloads[data_type].result()
+                total_rows += download_and_process_data(report_date, gaps_of_data, data_type, engine=engine,
+                                                        zip_buffer=zip_buffer, source=sources[data_type])
+
+        finalize_bulk_load(engine)
+        # Summed from the per-file INSERT row counts; no COUNT(*) of the new table
+        log_progress(f"Total rows in trading_data: {total_rows}")
         
         log_progress("Full data ingestion complete.", level="success")
         return True
@@ -332,6 +400,10 @@ def run_full_ingestion(report_date, gaps_of_data, engine):
         log_progress(f"Data ingestion failed: {str(e)}", level="error")
         return False
     finally:
+        # trading_data may have been replaced, so the page-level st.cache_data results are stale.
+        # Those cached functions take the engine as an underscore-prefixed argument, so Streamlit
+        # skips hashing it and this clear is their only invalidation besides the TTL.
+        st.cache_data.clear()
         data_prep_lock.release()
 
 # Data page logic
@@ -2,50 +2,50 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
 
-# Result page logic
-def result_page(engine):
-    st.header("Result Page")
-    months = st.number_input("Number of months back", min_value=1, value=3)
-    current_date = datetime.today().date()
-    start_date = current_date - timedelta(days=months * 30)
-    
-    # Use raw DBAPI syntax (%(name)s) for raw_connection
-    query_volume = """
-        SELECT ticker, SUM(volume) as total_volume
-        FROM trading_data
-        WHERE date >= %(start_date)s AND date <= %(current_date)s AND ticker <> 'VNINDEX'
-        GROUP BY ticker
-        ORDER BY total_volume DESC
-        LIMIT 10
-    """
-
+# Function to fetch the top 10 tickers by trading volume and by trading value
+# Results are cached per date range
+@st.cache_data(show_spinner=False, ttl=3600)
+def get_top_tickers(start_date, current_date, _engine):
+    # Both rankings share one scan and one GROUP BY over the date range; the top 10 of each
+    # are picked in pandas from the per-ticker totals (a few thousand rows at most).
     # Use raw DBAPI syntax (%(name)s) for raw_connection
-    query_value = """
+    query = """
         SELECT ticker, 
-               SUM(CAST(close AS BIGINT) * CAST(volume AS BIGINT)) as total_value,
+               SUM(close * volume) as total_value,
                SUM(volume) as total_volume,
-               ROUND((SUM(CAST(close AS BIGINT) * CAST(volume AS BIGINT))::FLOAT / SUM(volume))::NUMERIC, 2) as avg_price
+               ROUND((SUM(close * volume)::FLOAT / NULLIF(SUM(volume), 0))::NUMERIC, 2) as avg_price
         FROM trading_data
         WHERE date >= %(start_date)s AND date <= %(current_date)s AND ticker <> 'VNINDEX'
         GROUP BY ticker
-        ORDER BY total_value DESC
-        LIMIT 10
     """
 
     params = {"start_date": start_date, "current_date": current_date}
     
     # Use a raw connection to bypass pandas/SQLAlchemy compatibility issues
-    conn = engine.raw_connection()
+    conn = _engine.raw_connection()
     try:
-        df_volume = pd.read_sql(query_volume, conn, params=params)
-        df_value = pd.read_sql(query_value, conn, params=params)
+        df_totals = pd.read_sql(query, conn, params=params)
     finally:
         conn.close()
 
+    # sort_values + head rather than nlargest: an empty result comes back with object dtypes
+    df_volume = df_totals.sort_values("total_volume", ascending=False).head(10)[["ticker", "total_volume"]].reset_index(drop=True)
+    df_value = df_totals.sort_values("total_value", ascending=False).head(10).reset_index(drop=True)
+    return df_volume, df_value
+
+# Result page logic
+def result_page(engine):
+    st.header("Result Page")
+    months = st.number_input("Number of months back", min_value=1, value=3)
+    current_date = datetime.today().date()
+    start_date = current_date - timedelta(days=months * 30)
+    
+    df_volume, df_value = get_top_tickers(start_date, current_date, engine)
+
     col1, col2 = st.columns([1, 2])
     with col1:
         st.subheader("Top 10 Trading Volume")
         st.dataframe(df_volume, use_container_width=True)
     with col2:
         st.subheader("Top 10 Trading Value")
-        st.dataframe(df_value, use_container_width=True)
\ No newline at end of file
+        st.dataframe(df_value, use_container_width=True)
@@ -7,6 +7,12 @@ from datetime import datetime, timedelta
 # Updated import to use the commons package prefix
 from commons.common_functions import analyze_ticker, get_all_tickers
 
+# Cached wrapper around get_all_tickers, kept in the pages layer so the API keeps calling it directly.
+# Results are cached per (min_avg_volume, year_gap).
+@st.cache_data(show_spinner=False, ttl=3600)
+def cached_get_all_tickers(min_avg_volume, year_gap, _engine):
+    return get_all_tickers(_engine, min_avg_volume, year_gap)
+
 # Main page function with volume filter
 def suggestion_page(engine):
     st.header("Suggestion Page")
@@ -25,7 +31,7 @@ def suggestion_page(engine):
     # Button to trigger analysis
     if st.button("Generate Suggestions"):
         min_avg_volume = volume_threshold * 1000  # Convert thousands to actual volume
-        tickers = get_all_tickers(engine, min_avg_volume, year_gap)
+        tickers = cached_get_all_tickers(min_avg_volume, year_gap, engine)
         
         if not tickers:
             st.warning("No tickers found with the specified volume threshold.")